@@ -0,0 +1,89 @@
+"""Numba-compiled geometry kernels for large batches (0-based indices).
+
+Importing this module imports Numba, so ring_analyzer.py only imports it
+when Numba is installed and a batch is large enough to use it.
+"""
+import math
+import numpy as np
+from numba import njit
+
+@njit(cache=True)
+def _clamp(cos_theta):
+    """Clamp a cosine to [-1, 1] to avoid floating-point errors, passing NaN through like np.clip."""
+    if cos_theta > 1.0:
+        return 1.0
+    if cos_theta < -1.0:
+        return -1.0
+    return cos_theta
+
+@njit(cache=True, error_model="numpy")
+def dist_batch(coords, pairs):
+    """Calculate distances for a (K, 2) array of atom pairs."""
+    out = np.empty(pairs.shape[0], dtype=coords.dtype)
+    for k in range(pairs.shape[0]):
+        i, j = pairs[k, 0], pairs[k, 1]
+        dx = coords[i, 0] - coords[j, 0]
+        dy = coords[i, 1] - coords[j, 1]
+        dz = coords[i, 2] - coords[j, 2]
+        out[k] = math.sqrt(dx * dx + dy * dy + dz * dz)
+    return out
+
+@njit(cache=True, error_model="numpy")
+def angle_batch(coords, triples):
+    """Calculate angles (degrees) for an (N, 3) array of atom triples, vertex in the middle."""
+    out = np.empty(triples.shape[0], dtype=coords.dtype)
+    for k in range(triples.shape[0]):
+        a, b, c = triples[k, 0], triples[k, 1], triples[k, 2]
+        v1x = coords[a, 0] - coords[b, 0]
+        v1y = coords[a, 1] - coords[b, 1]
+        v1z = coords[a, 2] - coords[b, 2]
+        v2x = coords[c, 0] - coords[b, 0]
+        v2y = coords[c, 1] - coords[b, 1]
+        v2z = coords[c, 2] - coords[b, 2]
+        cos_theta = (v1x * v2x + v1y * v2y + v1z * v2z) / math.sqrt(
+            (v1x * v1x + v1y * v1y + v1z * v1z) * (v2x * v2x + v2y * v2y + v2z * v2z))
+        cos_theta = _clamp(cos_theta)
+        out[k] = math.degrees(math.acos(cos_theta))
+    return out
+
+@njit(cache=True, error_model="numpy")
+def dihedral_batch(coords, quads):
+    """Calculate dihedral angles (degrees) for an (N, 4) array of atom quadruples."""
+    out = np.empty(quads.shape[0], dtype=coords.dtype)
+    for k in range(quads.shape[0]):
+        p0, p1, p2, p3 = quads[k, 0], quads[k, 1], quads[k, 2], quads[k, 3]
+
+        # Vectors for the three bonds
+        b0x = coords[p1, 0] - coords[p0, 0]
+        b0y = coords[p1, 1] - coords[p0, 1]
+        b0z = coords[p1, 2] - coords[p0, 2]
+        b1x = coords[p2, 0] - coords[p1, 0]
+        b1y = coords[p2, 1] - coords[p1, 1]
+        b1z = coords[p2, 2] - coords[p1, 2]
+        b2x = coords[p3, 0] - coords[p2, 0]
+        b2y = coords[p3, 1] - coords[p2, 1]
+        b2z = coords[p3, 2] - coords[p2, 2]
+
+        # Normals to the planes
+        n1x = b0y * b1z - b0z * b1y
+        n1y = b0z * b1x - b0x * b1z
+        n1z = b0x * b1y - b0y * b1x
+        n2x = b1y * b2z - b1z * b2y
+        n2y = b1z * b2x - b1x * b2z
+        n2z = b1x * b2y - b1y * b2x
+
+        # Normalize normals
+        n1_norm = math.sqrt(n1x * n1x + n1y * n1y + n1z * n1z)
+        n2_norm = math.sqrt(n2x * n2x + n2y * n2y + n2z * n2z)
+        n1x, n1y, n1z = n1x / n1_norm, n1y / n1_norm, n1z / n1_norm
+        n2x, n2y, n2z = n2x / n2_norm, n2y / n2_norm, n2z / n2_norm
+
+        cos_theta = n1x * n2x + n1y * n2y + n1z * n2z
+        cos_theta = _clamp(cos_theta)
+
+        # Take the sign from b1 . (n1 x n2)
+        sign = (b1x * (n1y * n2z - n1z * n2y)
+                + b1y * (n1z * n2x - n1x * n2z)
+                + b1z * (n1x * n2y - n1y * n2x))
+        out[k] = math.copysign(math.degrees(math.acos(cos_theta)), sign + 0.0)  # + 0.0 turns -0.0 into 0.0
+    return out
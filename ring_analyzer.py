@@ -1,28 +1,90 @@
 import numpy as np
 import argparse
+import importlib.util
+import math
 import sys
 import os
 
+# Numba is optional; _kernels (which imports it) is loaded only when a batch is large enough to use it
+HAS_NUMBA = importlib.util.find_spec("numba") is not None
+
+# Scalar 3-vector helpers: plain float math avoids NumPy dispatch overhead on single calls
+def _sub3(a, b):
+    """Return a - b for two 3-vectors."""
+    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
+
+def _dot3(a, b):
+    """Return the dot product of two 3-vectors."""
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+def _cross3(a, b):
+    """Return the cross product of two 3-vectors."""
+    return (a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0])
+
+def _norm3(v):
+    """Return the length of a 3-vector."""
+    return math.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+
+def _angle3(a, b):
+    """Return the angle (degrees) between two 3-vectors, NaN if either has zero length."""
+    norms = _norm3(a) * _norm3(b)
+    if norms == 0.0:
+        return math.nan
+    cos_theta = min(1.0, max(-1.0, _dot3(a, b) / norms))  # Clamp to avoid floating-point errors
+    return math.degrees(math.acos(cos_theta))
+
 class Molecule:
+    DTYPE = np.float64  # Coordinate precision; np.float32 halves memory traffic for batched geometry
+    JIT_MIN_BATCH = 512  # Batches at least this large use the Numba kernels when available
+
     def __init__(self, filename):
         """Initialize molecule from an XYZ file."""
         self.atoms = []
         self.coords = []
+        self._extra_coords = []  # Positions of added atoms not yet merged into coords
         self.read_xyz(filename)
 
+    @property
+    def coords(self):
+        """Coordinates of all atoms, including any added since the last access."""
+        if self._extra_coords:
+            self._sync()
+        return self._coords
+
+    @coords.setter
+    def coords(self, value):
+        self._coords = value
+
+    def _sync(self):
+        """Merge pending added atom positions into the coordinate array in one copy."""
+        self._coords = np.concatenate([self._coords, np.asarray(self._extra_coords, dtype=self._coords.dtype)], axis=0)
+        self._extra_coords = []
+
     def read_xyz(self, filename):
         """Read XYZ file into atoms and coordinates."""
         try:
             with open(filename, 'r') as f:
                 lines = f.readlines()
                 n_atoms = int(lines[0].strip())
-                for line in lines[2:2 + n_atoms]:
+            atom_lines = lines[2:2 + n_atoms]
+            try:
+                # Parse the whole atom block in C rather than converting floats line by line
+                # loadtxt raises ValueError on any unconvertible field, so bad lines reach the fallback
+                coords = np.loadtxt(atom_lines, usecols=(1, 2, 3), dtype=self.DTYPE, ndmin=2)
+                if len(coords) != len(atom_lines):
+                    raise ValueError("Invalid XYZ format")
+                # Symbols are split off in Python so they keep their full length
+                self.atoms = [line.split(None, 1)[0] for line in atom_lines]
+                self.coords = coords
+            except ValueError:
+                # Fall back to line-by-line parsing, which reports malformed lines
+                for line in atom_lines:
                     parts = line.strip().split()
                     if len(parts) < 4:
                         raise ValueError("Invalid XYZ format")
                     self.atoms.append(parts[0])
                     self.coords.append(list(map(float, parts[1:4])))
-                self.coords = np.array(self.coords)
+                self.coords = np.ascontiguousarray(self.coords, dtype=self.DTYPE)
         except FileNotFoundError:
             print(f"Error: File '{filename}' not found.")
             sys.exit(1)
@@ -32,65 +94,115 @@ class Molecule:
 
     def get_centroid(self, ring_atoms):
         """Calculate centroid of specified ring atoms (1-based indices)."""
-        if not all(1 <= i <= len(self.coords) for i in ring_atoms):
+        idx_array = np.asarray(ring_atoms, dtype=np.intp)
+        if idx_array.min() < 1 or idx_array.max() > len(self.coords):
             raise ValueError("Atom indices out of range")
-        ring_coords = self.coords[np.array(ring_atoms) - 1]  # Convert to 0-based
-        return np.mean(ring_coords, axis=0)
+        return np.mean(self.coords[idx_array - 1], axis=0)  # Convert to 0-based
+
+    def get_centroids_idx(self, idx_arrays):
+        """Calculate centroids of several rings (validated 0-based index arrays) in one gather and reduction."""
+        sizes = np.array([len(idx_array) for idx_array in idx_arrays])
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        return np.add.reduceat(self.coords[np.concatenate(idx_arrays)], starts, axis=0) / sizes[:, None]
 
     def add_atom(self, atom_symbol, position):
         """Add a new atom at the specified position."""
         self.atoms.append(atom_symbol)
-        self.coords = np.vstack([self.coords, position])
+        self._extra_coords.append(position)
+
+    def _batch_idx(self, atoms):
+        """Convert an array of 1-based atom numbers to 0-based indices, rejecting out-of-range atoms."""
+        idx = np.asarray(atoms, dtype=np.intp) - 1
+        # Checked here so the NumPy and Numba backends fail alike (Numba does not bounds-check)
+        if idx.size and (idx.min() < 0 or idx.max() >= len(self.coords)):
+            raise IndexError("Atom indices out of range")
+        return idx
 
     def distance(self, idx1, idx2):
         """Calculate distance between two atoms (1-based indices)."""
-        return np.linalg.norm(self.coords[idx1 - 1] - self.coords[idx2 - 1])
+        coords = self.coords
+        return _norm3(_sub3(coords[idx1 - 1].tolist(), coords[idx2 - 1].tolist()))
+
+    def distance_pairs(self, pairs):
+        """Calculate distances for a (K, 2) array of atom pairs (1-based indices)."""
+        pairs = self._batch_idx(pairs)
+        if HAS_NUMBA and len(pairs) >= self.JIT_MIN_BATCH:
+            import _kernels
+            return _kernels.dist_batch(self.coords, pairs)
+        d = self.coords[pairs[:, 0]]  # Fancy indexing copies, so d can be reused as workspace
+        np.subtract(d, self.coords[pairs[:, 1]], out=d)
+        dist = np.einsum('ij,ij->i', d, d)
+        return np.sqrt(dist, out=dist)
 
     def angle(self, idx1, idx2, idx3):
         """Calculate angle (degrees) between three atoms (1-based indices)."""
-        v1 = self.coords[idx1 - 1] - self.coords[idx2 - 1]  # Vector from idx2 to idx1
-        v2 = self.coords[idx3 - 1] - self.coords[idx2 - 1]  # Vector from idx2 to idx3
-        cos_theta = np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
+        coords = self.coords
+        p1, p2, p3 = coords[idx1 - 1].tolist(), coords[idx2 - 1].tolist(), coords[idx3 - 1].tolist()
+        return _angle3(_sub3(p1, p2), _sub3(p3, p2))  # Vectors from idx2 to idx1 and to idx3
+
+    def angles_batch(self, triples):
+        """Calculate angles (degrees) for an (N, 3) array of atom triples (1-based indices)."""
+        triples = self._batch_idx(triples)
+        if HAS_NUMBA and len(triples) >= self.JIT_MIN_BATCH:
+            import _kernels
+            return _kernels.angle_batch(self.coords, triples)
+        points = self.coords[triples]  # Shape (N, 3, 3)
+        v1 = points[:, 0] - points[:, 1]  # Vectors from the middle atom to the first
+        v2 = points[:, 2] - points[:, 1]  # Vectors from the middle atom to the last
+        cos_theta = np.einsum('ij,ij->i', v1, v2) / (np.linalg.norm(v1, axis=1) * np.linalg.norm(v2, axis=1))
         cos_theta = np.clip(cos_theta, -1.0, 1.0)  # Clamp to avoid floating-point errors
         return np.degrees(np.arccos(cos_theta))
 
     def dihedral(self, idx1, idx2, idx3, idx4):
         """Calculate dihedral angle (degrees) between four atoms (1-based indices)."""
-        p0 = self.coords[idx1 - 1]
-        p1 = self.coords[idx2 - 1]
-        p2 = self.coords[idx3 - 1]
-        p3 = self.coords[idx4 - 1]
+        coords = self.coords
+        p0, p1 = coords[idx1 - 1].tolist(), coords[idx2 - 1].tolist()
+        p2, p3 = coords[idx3 - 1].tolist(), coords[idx4 - 1].tolist()
 
         # Vectors for the three bonds
-        b0 = p1 - p0
-        b1 = p2 - p1
-        b2 = p3 - p2
+        b0 = _sub3(p1, p0)
+        b1 = _sub3(p2, p1)
+        b2 = _sub3(p3, p2)
 
         # Normals to the planes
-        n1 = np.cross(b0, b1)
-        n2 = np.cross(b1, b2)
+        n1 = _cross3(b0, b1)
+        n2 = _cross3(b1, b2)
 
-        # Normalize normals
-        n1 = n1 / np.linalg.norm(n1)
-        n2 = n2 / np.linalg.norm(n2)
+        # Take the sign of the dihedral angle from b1 . (n1 x n2)
+        return math.copysign(_angle3(n1, n2), _dot3(b1, _cross3(n1, n2)) + 0.0)  # + 0.0 turns -0.0 into 0.0
 
-        # Calculate dihedral angle
-        cos_theta = np.dot(n1, n2)
-        cos_theta = np.clip(cos_theta, -1.0, 1.0)  # Clamp to avoid floating-point errors
-        angle = np.degrees(np.arccos(cos_theta))
+    def dihedrals_batch(self, quads):
+        """Calculate dihedral angles (degrees) for an (N, 4) array of atom quadruples (1-based indices)."""
+        quads = self._batch_idx(quads)
+        if HAS_NUMBA and len(quads) >= self.JIT_MIN_BATCH:
+            import _kernels
+            return _kernels.dihedral_batch(self.coords, quads)
+        points = self.coords[quads]  # Shape (N, 4, 3)
+
+        # Vectors for the three bonds of every quadruple, shape (N, 3, 3)
+        b = np.diff(points, axis=1)
+
+        # Normalized normals to the planes, both from one cross product, shape (N, 2, 3)
+        n = np.cross(b[:, :-1], b[:, 1:])
+        np.divide(n, np.linalg.norm(n, axis=2, keepdims=True), out=n)
+        n1, n2 = n[:, 0], n[:, 1]
+
+        # Reuse one buffer for cosine -> radians -> degrees -> signed degrees
+        angles = np.einsum('ij,ij->i', n1, n2)
+        np.clip(angles, -1.0, 1.0, out=angles)  # Clamp to avoid floating-point errors
+        np.arccos(angles, out=angles)
+        np.degrees(angles, out=angles)
 
-        # Determine the sign of the dihedral angle
-        if np.dot(b1, np.cross(n1, n2)) < 0:
-            angle = -angle
-        return angle
+        # Take the sign of each dihedral angle from b1 . (n1 x n2)
+        return np.copysign(angles, np.einsum('ij,ij->i', b[:, 1], np.cross(n1, n2)) + 0.0, out=angles)  # + 0.0 turns -0.0 into 0.0
 
     def write_xyz(self, filename):
         """Write molecule to an XYZ file."""
+        header = f"{len(self.atoms)}\nGenerated by ring_analyzer.py\n"
+        # tolist() yields Python floats, avoiding NumPy scalar formatting per coordinate
+        body = "".join(f"{atom} {x:.6f} {y:.6f} {z:.6f}\n" for atom, (x, y, z) in zip(self.atoms, self.coords.tolist()))
         with open(filename, 'w') as f:
-            f.write(f"{len(self.atoms)}\n")
-            f.write("Generated by ring_analyzer.py\n")
-            for atom, coord in zip(self.atoms, self.coords):
-                f.write(f"{atom} {coord[0]:.6f} {coord[1]:.6f} {coord[2]:.6f}\n")
+            f.write(header + body)
 
 def main():
     # Command-line argument parsing with detailed help
@@ -152,14 +264,28 @@ def main():
         print("Error: --metal2 specified but only 2 rings provided.")
         sys.exit(1)
 
+    # Convert ring atom numbers to 0-based index arrays once
+    ring_idx = {label: np.asarray(ring, dtype=np.intp) - 1 for label, ring in rings.items()}
+
     # Load molecule
     mol = Molecule(args.xyz_file)
 
+    for label, idx_array in ring_idx.items():
+        if idx_array.min() < 0 or idx_array.max() >= len(mol.atoms):
+            print(f"Error: {label} atom indices out of range.")
+            sys.exit(1)
+
+    # Build atom labels (e.g. C3) once for reuse in the printed output
+    labels = [f"{symbol}{i}" for i, symbol in enumerate(mol.atoms, 1)]
+
+    def atom_label(idx):
+        """Return the label of an atom (1-based index)."""
+        return labels[idx - 1]
+
     # Calculate centroids and add dummy atoms
     centroids = {}
     dummy_indices = {}
-    for i, (label, ring_atoms) in enumerate(rings.items(), 1):
-        centroid = mol.get_centroid(ring_atoms)
+    for i, centroid in enumerate(mol.get_centroids_idx(list(ring_idx.values())), 1):
         centroids[f"com{i}"] = centroid
         print(f"Ring {i} centroid: {centroid[0]:.4f}, {centroid[1]:.4f}, {centroid[2]:.4f}")
         mol.add_atom("X", centroid)
@@ -169,55 +295,68 @@ def main():
 
     # Calculate distances
     metal1_idx = args.metal1
-    metal1_symbol = f"{mol.atoms[metal1_idx - 1]}{metal1_idx}"
+    metal1_symbol = atom_label(metal1_idx)
 
     if len(rings) == 3:
         metal2_idx = args.metal2
-        metal2_symbol = f"{mol.atoms[metal2_idx - 1]}{metal2_idx}"
+        metal2_symbol = atom_label(metal2_idx)
 
         # Dynamically assign metals based on proximity to ring1 and ring3
-        dist_m1_r1 = mol.distance(metal1_idx, dummy_indices['com1'])
-        dist_m1_r3 = mol.distance(metal1_idx, dummy_indices['com3'])
-        dist_m2_r1 = mol.distance(metal2_idx, dummy_indices['com1'])
-        dist_m2_r3 = mol.distance(metal2_idx, dummy_indices['com3'])
+        # All metal-centroid distances are computed once and reused after any swap
+        (dist_m1_r1, dist_m1_r2, dist_m1_r3,
+         dist_m2_r1, dist_m2_r2, dist_m2_r3, dist_m1_m2) = mol.distance_pairs([
+            [metal1_idx, dummy_indices['com1']],
+            [metal1_idx, dummy_indices['com2']],
+            [metal1_idx, dummy_indices['com3']],
+            [metal2_idx, dummy_indices['com1']],
+            [metal2_idx, dummy_indices['com2']],
+            [metal2_idx, dummy_indices['com3']],
+            [metal1_idx, metal2_idx],
+        ])
 
         # If metal1 is closer to ring3 than ring1, swap metal1 and metal2
         if dist_m1_r3 < dist_m1_r1 and dist_m2_r1 < dist_m2_r3:
             metal1_idx, metal2_idx = metal2_idx, metal1_idx
-            metal1_symbol = f"{mol.atoms[metal1_idx - 1]}{metal1_idx}"
-            metal2_symbol = f"{mol.atoms[metal2_idx - 1]}{metal2_idx}"
+            metal1_symbol = atom_label(metal1_idx)
+            metal2_symbol = atom_label(metal2_idx)
+            dist_m1_r1, dist_m2_r1 = dist_m2_r1, dist_m1_r1
+            dist_m1_r2, dist_m2_r2 = dist_m2_r2, dist_m1_r2
+            dist_m1_r3, dist_m2_r3 = dist_m2_r3, dist_m1_r3
             print("Note: Swapped metal1 and metal2 based on proximity to ring1 and ring3.")
 
-        print(f"Distance from {metal1_symbol} to Ring 1 centroid: {mol.distance(metal1_idx, dummy_indices['com1']):.4f} Å")
-        print(f"Distance from {metal1_symbol} to Ring 2 centroid: {mol.distance(metal1_idx, dummy_indices['com2']):.4f} Å")
-        print(f"Distance from {metal2_symbol} to Ring 2 centroid: {mol.distance(metal2_idx, dummy_indices['com2']):.4f} Å")
-        print(f"Distance from {metal2_symbol} to Ring 3 centroid: {mol.distance(metal2_idx, dummy_indices['com3']):.4f} Å")
-        print(f"Distance from {metal1_symbol} to {metal2_symbol}: {mol.distance(metal1_idx, metal2_idx):.4f} Å")
+        print(f"Distance from {metal1_symbol} to Ring 1 centroid: {dist_m1_r1:.4f} Å")
+        print(f"Distance from {metal1_symbol} to Ring 2 centroid: {dist_m1_r2:.4f} Å")
+        print(f"Distance from {metal2_symbol} to Ring 2 centroid: {dist_m2_r2:.4f} Å")
+        print(f"Distance from {metal2_symbol} to Ring 3 centroid: {dist_m2_r3:.4f} Å")
+        print(f"Distance from {metal1_symbol} to {metal2_symbol}: {dist_m1_m2:.4f} Å")
 
         # Calculate bond distances for middle ring (ring2)
         print("\nBond distances in middle ring (ring2):")
         ring2_atoms = args.ring2
+        ring2_array = np.asarray(ring2_atoms)
+        ring2_bonds = np.column_stack([ring2_array, np.roll(ring2_array, -1)])  # Cyclic: connects last to first
+        bond_dists = mol.distance_pairs(ring2_bonds)
         for i in range(len(ring2_atoms)):
             atom1 = ring2_atoms[i]
-            atom2 = ring2_atoms[(i + 1) % len(ring2_atoms)]  # Cyclic: connects last to first
-            atom1_symbol = f"{mol.atoms[atom1 - 1]}{atom1}"
-            atom2_symbol = f"{mol.atoms[atom2 - 1]}{atom2}"
-            dist = mol.distance(atom1, atom2)
-            print(f"Distance {atom1_symbol}--{atom2_symbol}: {dist:.4f} Å")
+            atom2 = ring2_atoms[(i + 1) % len(ring2_atoms)]
+            atom1_symbol = atom_label(atom1)
+            atom2_symbol = atom_label(atom2)
+            print(f"Distance {atom1_symbol}--{atom2_symbol}: {bond_dists[i]:.4f} Å")
 
         # Calculate dihedral angles for middle ring (ring2)
         print("\nDihedral angles in middle ring (ring2):")
+        ring2_quads = np.stack([np.roll(ring2_array, -k) for k in range(4)], axis=1)  # Cyclic 4-tuples
+        dihedrals = mol.dihedrals_batch(ring2_quads)
         for i in range(len(ring2_atoms)):
             idx1 = ring2_atoms[i]
             idx2 = ring2_atoms[(i + 1) % len(ring2_atoms)]
             idx3 = ring2_atoms[(i + 2) % len(ring2_atoms)]
             idx4 = ring2_atoms[(i + 3) % len(ring2_atoms)]
-            atom1_symbol = f"{mol.atoms[idx1 - 1]}{idx1}"
-            atom2_symbol = f"{mol.atoms[idx2 - 1]}{idx2}"
-            atom3_symbol = f"{mol.atoms[idx3 - 1]}{idx3}"
-            atom4_symbol = f"{mol.atoms[idx4 - 1]}{idx4}"
-            dihedral = mol.dihedral(idx1, idx2, idx3, idx4)
-            print(f"Dihedral {atom1_symbol}-{atom2_symbol}-{atom3_symbol}-{atom4_symbol}: {dihedral:.2f} degrees")
+            atom1_symbol = atom_label(idx1)
+            atom2_symbol = atom_label(idx2)
+            atom3_symbol = atom_label(idx3)
+            atom4_symbol = atom_label(idx4)
+            print(f"Dihedral {atom1_symbol}-{atom2_symbol}-{atom3_symbol}-{atom4_symbol}: {dihedrals[i]:.2f} degrees")
     else:  # 2 rings
         print(f"Distance from {metal1_symbol} to Ring 2 centroid: {mol.distance(metal1_idx, dummy_indices['com2']):.4f} Å")
 